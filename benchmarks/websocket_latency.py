@@ -0,0 +1,147 @@
+"""Compare channel delivery latency to a raw TCP and a WebSocket client.
+
+A sender on plain TCP posts timestamped PRIVMSGs to a channel joined by
+one TCP and one WebSocket receiver, all served by the same Ircd.
+
+Run from the repository root (the MOTD is read from the cwd):
+
+    python benchmarks/websocket_latency.py [count]
+"""
+import asyncio
+import base64
+import os
+import statistics
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyircd import Ircd, replies, server, websocket
+
+TCP_PORT = 16667
+WS_PORT = 18067
+CHANNEL = '#bench'
+
+
+class TcpConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, line):
+        self.writer.write((line + '\r\n').encode('utf-8'))
+
+    @asyncio.coroutine
+    def recv(self):
+        line = yield from self.reader.readline()
+        return line.decode('utf-8').rstrip('\r\n')
+
+
+class WebSocketConnection(TcpConnection):
+    def send(self, line):
+        payload = bytearray(line.encode('utf-8'))
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x81, 0x80 | length)
+        else:
+            header = struct.pack('!BBH', 0x81, 0x80 | 126, length)
+        websocket.unmask(mask, payload)
+        self.writer.write(header + mask + payload)
+
+    @asyncio.coroutine
+    def recv(self):
+        fin, opcode, payload = yield from websocket.read_frame(self.reader)
+        return payload.decode('utf-8')
+
+
+@asyncio.coroutine
+def connect_tcp(loop):
+    reader, writer = yield from asyncio.open_connection(
+        '127.0.0.1', TCP_PORT, loop=loop)
+    return TcpConnection(reader, writer)
+
+
+@asyncio.coroutine
+def connect_websocket(loop):
+    reader, writer = yield from asyncio.open_connection(
+        '127.0.0.1', WS_PORT, loop=loop)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((
+        'GET / HTTP/1.1\r\n'
+        'Host: 127.0.0.1\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        'Sec-WebSocket-Key: {}\r\n'
+        'Sec-WebSocket-Version: 13\r\n'
+        'Sec-WebSocket-Protocol: {}\r\n\r\n'
+    ).format(key, websocket.SUBPROTOCOL).encode('latin-1'))
+    while (yield from reader.readline()).strip():
+        pass
+    return WebSocketConnection(reader, writer)
+
+
+@asyncio.coroutine
+def register(conn, nickname):
+    conn.send('NICK {}'.format(nickname))
+    conn.send('USER {0} 0 * :{0}'.format(nickname))
+    conn.send('JOIN {}'.format(CHANNEL))
+    while True:
+        line = yield from conn.recv()
+        if ' {} '.format(replies.RPL_ENDOFNAMES) in line:
+            return
+
+
+@asyncio.coroutine
+def wait_for_message(conn, latencies):
+    while True:
+        line = yield from conn.recv()
+        if ' PRIVMSG ' in line:
+            sent = float(line.rsplit(' ', 1)[1])
+            latencies.append(time.perf_counter() - sent)
+            return
+
+
+@asyncio.coroutine
+def run(loop, count):
+    sender = yield from connect_tcp(loop)
+    tcp_receiver = yield from connect_tcp(loop)
+    ws_receiver = yield from connect_websocket(loop)
+    yield from register(sender, 'sender')
+    yield from register(tcp_receiver, 'tcprecv')
+    yield from register(ws_receiver, 'wsrecv')
+
+    tcp_latencies = []
+    ws_latencies = []
+    for _ in range(count):
+        waiters = [
+            wait_for_message(tcp_receiver, tcp_latencies),
+            wait_for_message(ws_receiver, ws_latencies),
+        ]
+        sender.send('PRIVMSG {} :{!r}'.format(CHANNEL, time.perf_counter()))
+        yield from asyncio.wait(waiters, loop=loop)
+
+    for name, latencies in (('tcp', tcp_latencies),
+                            ('websocket', ws_latencies)):
+        print('{:>10}: median {:8.1f}us  mean {:8.1f}us  max {:8.1f}us'
+              .format(name,
+                      statistics.median(latencies) * 1e6,
+                      statistics.mean(latencies) * 1e6,
+                      max(latencies) * 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    loop = asyncio.get_event_loop()
+    ircd = Ircd(loop=loop)
+    ircd.add_server(server.Server(port=TCP_PORT, host='127.0.0.1', loop=loop))
+    ircd.add_server(websocket.WebSocketServer(
+        port=WS_PORT, host='127.0.0.1', loop=loop))
+    asyncio.async(ircd.run_forever())
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    loop.run_until_complete(run(loop, count))
+
+
+if __name__ == '__main__':
+    main()
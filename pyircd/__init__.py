@@ -1,8 +1,13 @@
 
 import functools
 import asyncio
+import os
+import signal
+import sys
+import time
+from collections import OrderedDict
 from asyncio.streams import StreamReader, StreamWriter
-from . import server, utils, exceptions, replies
+from . import server, utils, exceptions, replies, capture, profiler
 
 
 def registration_required(func):
@@ -29,7 +34,15 @@ class Ircd:
     clientes and opened channels.
     """
 
-    def __init__(self, loop=None):
+    # process_message calls taking longer than this many seconds are
+    # logged, None disables the log
+    slow_command_threshold = 0.05
+
+    # maximum number of comma separated targets of PRIVMSG and NOTICE,
+    # advertised to clients as TARGMAX
+    max_targets = 4
+
+    def __init__(self, loop=None, capture_path=None):
         if loop is None:
             loop = asyncio.get_event_loop()
         self.loop = loop
@@ -42,6 +55,14 @@ class Ircd:
 
         self.servers = []
 
+        # every event taken from server_queue is appended to this
+        # file, to be fed back later with pyircd.replay
+        self.capture = None
+        if capture_path is not None:
+            self.capture = capture.CaptureWriter(capture_path)
+
+        self.profiler = profiler.SamplingProfiler()
+
     def add_server(self, srv):
         self.servers.append(srv)
         srv.queue = self.server_queue
@@ -51,23 +72,56 @@ class Ircd:
     def run_forever(self):
         while True:
             event, *params = yield from self.server_queue.get()
-            if event == server.EVENT_NEW_CLIENT:
-                client, = params
-                self.clients.append(client)
-                print('New Client: {}'.format(client))
-            elif event == server.EVENT_LOST_CLIENT:
-                client, = params
-                self.clients.remove(client)
-                print('Lost Client: {}'.format(client))
-            elif event == server.EVENT_MESSAGE:
-                client, message = params
-                if message.command:
-                    try:
-                        self.process_message(client, message)
-                    except exceptions.IrcError as exc:
-                        client.send_error(exc.number, exc.params)
-                    except Exception as exc:
-                        client.send_error()
+            if self.capture is not None:
+                self.capture.record(event, *params)
+            self.handle_event(event, *params)
+            if self.capture is not None and self.server_queue.empty():
+                # write out whole records whenever the loop goes idle
+                self.capture.flush()
+
+    def handle_event(self, event, *params):
+        if event == server.EVENT_NEW_CLIENT:
+            client, = params
+            self.clients.append(client)
+            print('New Client: {}'.format(client))
+        elif event == server.EVENT_LOST_CLIENT:
+            client, = params
+            self.clients.remove(client)
+            print('Lost Client: {}'.format(client))
+        elif event == server.EVENT_MESSAGE:
+            client, message = params
+            if message.command:
+                try:
+                    self.process_message(client, message)
+                except exceptions.IrcError as exc:
+                    client.send_error(exc.number, exc.params)
+                except Exception as exc:
+                    client.send_error()
+
+    def install_profile_signal(self, signum=None, seconds=30):
+        """Start the sampling profiler for the given number of seconds
+        whenever the process receives signum, SIGUSR1 by default.
+
+        Does nothing where the signal or loop signal handlers are not
+        available, like on Windows.
+        """
+        if signum is None:
+            signum = getattr(signal, 'SIGUSR1', None)
+            if signum is None:
+                return
+        try:
+            self.loop.add_signal_handler(
+                signum, self.start_profiler, seconds)
+        except NotImplementedError:
+            pass
+
+    def start_profiler(self, seconds):
+        if self.profiler.running:
+            print('Profiler is already running')
+            return
+        path = 'pyircd-{}-{}.folded'.format(os.getpid(), int(time.time()))
+        print('Profiling for {}s into {}'.format(seconds, path))
+        self.profiler.start(seconds, path)
 
     def process_message(self, client, message):
         func = getattr(self, 'on_{}'.format(message.command.lower()), None)
@@ -76,7 +130,49 @@ class Ircd:
                 replies.ERR_UNKNOWNCOMMAND,
                 [message.command, 'Unknown command'])
             return
-        func(client, message)
+        if self.slow_command_threshold is None:
+            func(client, message)
+            return
+        start = time.perf_counter()
+        try:
+            func(client, message)
+        finally:
+            duration = time.perf_counter() - start
+            if duration > self.slow_command_threshold:
+                self.log_slow_command(message, duration)
+
+    def log_slow_command(self, message, duration):
+        # summed size of all channels targeted by the first parameter,
+        # counted in one pass over memberships
+        channel_size = 0
+        if message.params:
+            targets = {
+                utils.normalize_name(target).lower()
+                for target in message.params[0].split(',')
+            }
+            targets &= self.channels.keys()
+            if targets:
+                channel_size = sum(
+                    1 for channame, clnt, mode in self.memberships
+                    if channame.lower() in targets)
+        print('Slow command: {} took {:.1f}ms, {} params, channel size {}'
+              .format(message.command, duration * 1e3,
+                      len(message.params), channel_size),
+              file=sys.stderr)
+
+    def send_to_clients(self, clients, command, prefix=None, params=None):
+        """Send the same message to many clients.
+
+        The line is serialized once, and encoded once per listener, so
+        every client on the same listener gets the very same bytes.
+        """
+        line = utils.format_line(command, prefix, params)
+        encoded = {}
+        for clnt in clients:
+            data = encoded.get(clnt.server)
+            if data is None:
+                data = encoded[clnt.server] = clnt.server.encode_line(line)
+            clnt.writer.write(data)
 
     def get_channel_clients(self, channel):
         for channame, client, mode in self.memberships:
@@ -111,7 +207,8 @@ class Ircd:
         client.server_send(
             5,
             ['NETWORK=BubiNet',
-             'PREFIX=(ov)@+']
+             'PREFIX=(ov)@+',
+             'TARGMAX=PRIVMSG:{0},NOTICE:{0}'.format(self.max_targets)]
         )
 
         # MOTD
@@ -162,12 +259,8 @@ class Ircd:
             recipients = recipients.union(
                 {clnt for clnt, mode in self.get_channel_clients(channel)}
             )
-        for other_client in recipients:
-            other_client.send(
-                message.command,
-                old_mask,
-                [new_nickname]
-            )
+        self.send_to_clients(
+            recipients, message.command, old_mask, [new_nickname])
 
     def on_user(self, client, message):
         check_param_count(message, 4)
@@ -179,22 +272,75 @@ class Ircd:
     def on_cap(self, client, message):
         pass
 
+    def send_message(self, client, message, reply_errors=True):
+        """Deliver a PRIVMSG or NOTICE to a comma separated list of
+        channels and nicknames.
+
+        Every connection receives the message at most once, for the
+        first target it is reached through. The sender only gets it
+        back when addressing their own nickname.
+        """
+        targets = OrderedDict()  # target.lower() -> target
+        if message.params:
+            for target in message.params[0].split(','):
+                target = utils.normalize_name(target)
+                if target:
+                    targets.setdefault(target.lower(), target)
+        if not targets:
+            if reply_errors:
+                raise exceptions.IrcError(
+                    replies.ERR_NORECIPIENT,
+                    ['No recipient given ({})'.format(message.command)])
+            return
+        if len(message.params) < 2 or message.params[1] == '':
+            if reply_errors:
+                raise exceptions.IrcError(
+                    replies.ERR_NOTEXTTOSEND, ['No text to send'])
+            return
+        text = message.params[1]
+
+        if len(targets) > self.max_targets:
+            if reply_errors:
+                raise exceptions.IrcError(
+                    replies.ERR_TOOMANYTARGETS,
+                    [message.params[0],
+                     'Too many recipients, maximum is {}'
+                     .format(self.max_targets)])
+            return
+
+        # members of all targeted channels, in one pass over memberships
+        members = {
+            lowered: set() for lowered in targets
+            if lowered in self.channels
+        }
+        for channame, clnt, mode in self.memberships:
+            clients = members.get(channame.lower())
+            if clients is not None:
+                clients.add(clnt)
+
+        delivered = set()
+        for lowered, target in targets.items():
+            if lowered in members:
+                recipients = members[lowered] - delivered - {client}
+            elif lowered in self.nicknames:
+                recipients = {self.nicknames[lowered]} - delivered
+            else:
+                if reply_errors:
+                    client.send_error(
+                        replies.ERR_NOSUCHNICK,
+                        [target, 'No such nick/channel'])
+                continue
+            delivered |= recipients
+            self.send_to_clients(
+                recipients, message.command, client.mask, [target, text])
+
     @registration_required
     def on_privmsg(self, client, message):
-        check_param_count(message, 2)
-        channel = utils.normalize_name(message.params[0])
-        text = message.params[1]
-        for other_client, mode in self.get_channel_clients(message.params[0]):
-            if other_client is not client:
-                other_client.send(
-                    message.command,
-                    client.mask,
-                    [channel, text]
-                )
+        self.send_message(client, message)
 
     @registration_required
     def on_notice(self, client, message):
-        pass
+        self.send_message(client, message, reply_errors=False)
 
     @registration_required
     def on_join(self, client, message):
@@ -209,13 +355,12 @@ class Ircd:
             mode = '@'
         self.memberships.append((join_channel, client, mode))
         names = []
+        recipients = []
         for other_client, mode in self.get_channel_clients(join_channel):
             names.append('{}{}'.format(mode, other_client.nickname))
-            other_client.send(
-                message.command,
-                client.mask,
-                [join_channel]
-            )
+            recipients.append(other_client)
+        self.send_to_clients(
+            recipients, message.command, client.mask, [join_channel])
         client.server_send(
             replies.RPL_NAMREPLY,
             ['=', join_channel, ' '.join(names)]
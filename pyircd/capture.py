@@ -0,0 +1,93 @@
+"""Compact append-only log of the events entering the Ircd core.
+
+The file starts with MAGIC, followed by records of the form:
+
+    event (1 byte) timestamp (double) client id (4 bytes)
+    payload length (2 bytes) payload
+
+For a new client the payload is 'kind remote_host remote_port
+local_host local_port', kind being the listener's Server.kind, for a
+message it is the line as received, for a lost client it is empty.
+Everything is big endian, strings are utf-8.
+
+Each time the daemon opens the file it appends an EVENT_SESSION_START
+record with an empty payload. Client ids are only unique within a
+session, and no client outlives the session it was created in.
+"""
+import struct
+import time
+from collections import namedtuple
+from . import server, utils
+
+MAGIC = b'PYIRCAP\x03'
+RECORD = struct.Struct('!BdIH')
+
+# not one of the server events, only found in capture files
+EVENT_SESSION_START = 0
+
+Event = namedtuple('event', 'event timestamp client_id payload')
+
+
+class CaptureWriter:
+    def __init__(self, path):
+        self.fp = open(path, 'ab')
+        if self.fp.tell() == 0:
+            self.fp.write(MAGIC)
+        else:
+            with open(path, 'rb') as existing:
+                if existing.read(len(MAGIC)) != MAGIC:
+                    self.fp.close()
+                    raise ValueError(
+                        '{} is not a capture file of this version'
+                        .format(path))
+        self.client_ids = {}  # client -> id
+        self.next_id = 0
+        self.write(EVENT_SESSION_START, 0)
+
+    def write(self, event, client_id, payload=b''):
+        self.fp.write(RECORD.pack(
+            event, time.time(), client_id, len(payload)))
+        self.fp.write(payload)
+
+    def record(self, event, client, message=None):
+        if event == server.EVENT_NEW_CLIENT:
+            self.next_id += 1
+            client_id = self.client_ids[client] = self.next_id
+            payload = '{} {} {} {} {}'.format(
+                client.server.kind, client.remote_host, client.remote_port,
+                client.local_host, client.local_port)
+        elif event == server.EVENT_LOST_CLIENT:
+            client_id = self.client_ids.pop(client, 0)
+            payload = ''
+        else:
+            client_id = self.client_ids.get(client, 0)
+            payload = message.line
+            if payload is None:
+                payload = utils.format_line(
+                    message.command, message.mask, message.params)
+        # the length field is 2 bytes, overlong lines are cut
+        self.write(event, client_id, payload.encode('utf-8')[:0xFFFF])
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+def read_capture(path):
+    """Yield an Event for each record in the capture file at path."""
+    with open(path, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a capture file'.format(path))
+        while True:
+            head = fp.read(RECORD.size)
+            if len(head) < RECORD.size:
+                # end of file, or a record cut short by a crash
+                break
+            event, timestamp, client_id, length = RECORD.unpack(head)
+            payload = fp.read(length)
+            if len(payload) < length:
+                break
+            yield Event(event, timestamp, client_id,
+                        payload.decode('utf-8', 'replace'))
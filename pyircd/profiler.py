@@ -0,0 +1,62 @@
+"""Sampling profiler to look into the running daemon.
+
+A background thread periodically takes the stack of the event loop
+thread, and once done writes the counts in the collapsed format read
+by flamegraph.pl and speedscope:
+
+    outermost;...;innermost count
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(
+        code.co_name, os.path.basename(code.co_filename),
+        code.co_firstlineno)
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, path):
+        """Sample the calling thread for the given number of seconds,
+        then write the collapsed stacks to path.
+        """
+        if self.running:
+            raise RuntimeError('Profiler is already running')
+        self.thread = threading.Thread(
+            target=self.run,
+            args=(threading.get_ident(), seconds, path),
+            daemon=True)
+        self.thread.start()
+
+    def run(self, thread_id, seconds, path):
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+        with open(path, 'w', encoding='utf-8') as fp:
+            for stack, count in stacks.most_common():
+                fp.write('{} {}\n'.format(stack, count))
+        print('Profile written to {} ({} samples)'.format(
+            path, sum(stacks.values())))
@@ -0,0 +1,128 @@
+"""Feed a capture file into an Ircd, without any sockets.
+
+Clients get in-memory writers which only count what was sent to them.
+The CPU time spent handling each event is summed per command. Every
+session of the capture, one per daemon run, is replayed into a fresh
+Ircd, and --realtime does not wait through the gaps between them.
+
+    python -m pyircd.replay capture.bin [--realtime]
+
+Run it from the directory containing motd.txt, like the daemon.
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+from collections import defaultdict
+from . import Ircd, capture, client, exceptions, server, utils, websocket
+
+LISTENERS = {
+    cls.kind: cls for cls in (server.Server, websocket.WebSocketServer)
+}
+
+
+class FakeWriter:
+    def __init__(self, peername, sockname):
+        self.extra_info = {'peername': peername, 'sockname': sockname}
+        self.bytes_written = 0
+
+    def get_extra_info(self, name, default=None):
+        return self.extra_info.get(name, default)
+
+    def write(self, data):
+        self.bytes_written += len(data)
+
+    def close(self):
+        pass
+
+
+def replay(path, realtime=False):
+    """Replay the capture at path, and return a dict mapping each
+    command to a [count, cpu_seconds] list.
+    """
+    stats = defaultdict(lambda: [0, 0.0])
+    for event, timestamp, client_id, payload in capture.read_capture(path):
+        if event == capture.EVENT_SESSION_START:
+            ircd = Ircd()
+            servers = {}  # (kind, local_port) -> server
+            clients = {}  # client id -> client
+            first_timestamp = timestamp
+            start = time.monotonic()
+            continue
+
+        if realtime:
+            delay = ((timestamp - first_timestamp) -
+                     (time.monotonic() - start))
+            if delay > 0:
+                time.sleep(delay)
+
+        if event == server.EVENT_NEW_CLIENT:
+            (kind, remote_host, remote_port,
+             local_host, local_port) = payload.split()
+            local_port = int(local_port)
+            srv = servers.get((kind, local_port))
+            if srv is None:
+                srv = servers[kind, local_port] = LISTENERS[kind](
+                    local_port, local_host,
+                    queue=ircd.server_queue, loop=ircd.loop)
+                ircd.servers.append(srv)
+            writer = FakeWriter((remote_host, int(remote_port)),
+                                (local_host, local_port))
+            clnt = clients[client_id] = client.Client(srv, writer)
+            params = clnt,
+            command = '<new client>'
+        elif event == server.EVENT_LOST_CLIENT:
+            if client_id not in clients:
+                continue
+            params = clients.pop(client_id),
+            command = '<lost client>'
+        elif event == server.EVENT_MESSAGE:
+            if client_id not in clients:
+                continue
+            try:
+                message = utils.parse_line(payload)
+            except exceptions.IrcError:
+                continue
+            params = clients[client_id], message
+            command = message.command
+        else:
+            raise ValueError('Unknown event {}'.format(event))
+
+        cpu_start = time.process_time()
+        ircd.handle_event(event, *params)
+        entry = stats[command]
+        entry[0] += 1
+        entry[1] += time.process_time() - cpu_start
+    return stats
+
+
+def print_stats(stats, wall_time, file=sys.stdout):
+    print('{:<16} {:>10} {:>12} {:>12}'.format(
+        'command', 'count', 'cpu ms', 'us/call'), file=file)
+    for command, (count, cpu) in sorted(
+            stats.items(), key=lambda item: item[1][1], reverse=True):
+        print('{:<16} {:>10} {:>12.3f} {:>12.3f}'.format(
+            command, count, cpu * 1e3, cpu / count * 1e6), file=file)
+    print('{} events replayed in {:.3f}s wall time'.format(
+        sum(count for count, cpu in stats.values()), wall_time), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a pyircd capture file without sockets.')
+    parser.add_argument('path')
+    parser.add_argument('--realtime', action='store_true',
+                        help='keep the recorded pacing between events')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    with open(os.devnull, 'w') as devnull:
+        # silence the connect/disconnect chatter of the core
+        with contextlib.redirect_stdout(devnull):
+            stats = replay(args.path, realtime=args.realtime)
+    print_stats(stats, time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ EVENT_MESSAGE = 3
 class Server:
     name = 'irc.example.org'
     version = 'pyircd-0.1'
+    kind = 'tcp'
 
     def __init__(self, port=6667, host='0.0.0.0', *,
                  queue=None, loop=None, encoding='utf-8'):
@@ -22,26 +23,37 @@ class Server:
         self.loop = loop
         self.encoding = encoding
 
+    def encode_line(self, line):
+        return (line + '\r\n').encode(self.encoding)
+
     def send_line(self, writer, line):
-        writer.write((line + '\r\n').encode(self.encoding))
+        writer.write(self.encode_line(line))
 
     def send(self, writer, command, prefix=None, params=None):
-        buflist = []
-        if params is None:
-            params = []
-        if prefix is not None:
-            buflist.append(':{}'.format(prefix))
-        if isinstance(command, int):
-            command = '{:03d}'.format(command)
-        buflist.append(command.upper())
-        buflist.extend(params)
-        if ' ' in buflist[-1]:
-            buflist[-1] = ':' + buflist[-1]
-        self.send_line(writer, ' '.join(buflist))
+        self.send_line(writer, utils.format_line(command, prefix, params))
 
     def send_error(self, writer, number, params):
         self.send(writer, number, prefix=self.name, params=params)
 
+    @asyncio.coroutine
+    def handle_line(self, clnt, line):
+        line = line.rstrip()
+        if not line:
+            return
+        try:
+            line = line.decode(self.encoding)
+        except UnicodeDecodeError as exc:
+            clnt.send_error(
+                replies.ERR_INCORRECTENCODING,
+                ['Incorrect encoding. You must use {}.'
+                 .format(self.encoding)]
+            )
+        else:
+            parsed_line = utils.parse_line(line)
+            yield from self.queue.put(
+                (EVENT_MESSAGE, clnt, parsed_line)
+            )
+
     @asyncio.coroutine
     def protocol_handler(self, reader, clnt):
         buf = b''
@@ -56,21 +68,7 @@ class Server:
             buf += data
             while b'\n' in buf:
                 line, buf = buf.split(b'\n', 1)
-                line = line.rstrip()
-                if line:
-                    try:
-                        line = line.decode(self.encoding)
-                    except UnicodeDecodeError as exc:
-                        clnt.send_error(
-                            replies.ERR_INCORRECTENCODING,
-                            ['Incorrect encoding. You must use {}.'
-                             .format(self.encoding)]
-                        )
-                    else:
-                        parsed_line = utils.parse_line(line)
-                        yield from self.queue.put(
-                            (EVENT_MESSAGE, clnt, parsed_line)
-                        )
+                yield from self.handle_line(clnt, line)
         yield from self.queue.put(
             (EVENT_LOST_CLIENT, clnt)
         )
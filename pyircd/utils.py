@@ -120,12 +120,35 @@ def split_prefix(prefix):
     return Prefix(*match.groups())
 
 
+def format_line(command, prefix=None, params=None):
+    """Serialize a command into a single line, without the line ending.
+
+    Of the form:
+    [:prefix] COMMAND params* [:trailing]
+    """
+    buflist = []
+    if params is None:
+        params = []
+    if prefix is not None:
+        buflist.append(':{}'.format(prefix))
+    if isinstance(command, int):
+        command = '{:03d}'.format(command)
+    buflist.append(command.upper())
+    buflist.extend(params)
+    if params:
+        trailing = params[-1]
+        if not trailing or ' ' in trailing or trailing.startswith(':'):
+            buflist[-1] = ':' + trailing
+    return ' '.join(buflist)
+
+
 def parse_line(line):
     """Parse line into a 3-tuple containing:
 
     (prefix_mask, command, parameters)
     prefix_mask might be None, and parameters the empty list.
     """
+    raw_line = line
     prefix_mask = None
     if line[0:1] == ':':
         if ' ' in line:
@@ -145,11 +168,12 @@ def parse_line(line):
     else:
         params = line.split()
 
-    return Message(prefix_mask, command.upper(), params)
+    return Message(prefix_mask, command.upper(), params, raw_line)
 
 
 class Message:
-    def __init__(self, prefix_mask, command, params):
+    def __init__(self, prefix_mask, command, params, line=None):
+        self.line = line
         self.mask = prefix_mask
         self.prefix = split_prefix(prefix_mask)
         self.command = command
@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import hashlib
+import struct
+from asyncio.streams import StreamReader, StreamWriter
+from . import client, server
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+SUBPROTOCOL = 'text.ircv3.net'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+MAX_HEADER_LINES = 100
+MAX_MESSAGE_SIZE = 8 << 10
+
+
+# translation tables XORing every byte value with a given mask byte
+XOR_TABLES = [bytes(value ^ key for value in range(256)) for key in range(256)]
+
+
+class HandshakeError(Exception):
+    pass
+
+
+class FrameError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+
+def accept_key(key):
+    digest = hashlib.sha1(key.encode('ascii') + WEBSOCKET_GUID).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def frame_header(length, opcode=OP_TEXT):
+    """Build the header of a single unmasked, final frame."""
+    if length < 126:
+        return struct.pack('!BB', 0x80 | opcode, length)
+    elif length < (1 << 16):
+        return struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        return struct.pack('!BBQ', 0x80 | opcode, 127, length)
+
+
+def build_frame(payload, opcode=OP_TEXT):
+    """Build a frame in one preallocated buffer, the payload being
+    copied in once right after the header.
+    """
+    header = frame_header(len(payload), opcode)
+    frame = bytearray(len(header) + len(payload))
+    frame[:len(header)] = header
+    frame[len(header):] = payload
+    return frame
+
+
+def write_frame(writer, payload, opcode=OP_TEXT):
+    writer.write(build_frame(payload, opcode))
+
+
+def unmask(mask, data):
+    """XOR the bytearray data with the 4 byte mask, in place.
+
+    Every fourth byte shares the same mask byte, so each of the four
+    strides is translated at once through a precomputed table.
+    """
+    for i in range(4):
+        data[i::4] = data[i::4].translate(XOR_TABLES[mask[i]])
+
+
+@asyncio.coroutine
+def read_frame(reader, require_mask=False):
+    """Read one frame and return (fin, opcode, payload)."""
+    head = yield from reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if require_mask and not masked:
+        raise FrameError(CLOSE_PROTOCOL_ERROR, 'Unmasked client frame')
+    if length == 126:
+        length, = struct.unpack('!H', (yield from reader.readexactly(2)))
+    elif length == 127:
+        length, = struct.unpack('!Q', (yield from reader.readexactly(8)))
+    if opcode & 0x8 and (not fin or length > 125):
+        raise FrameError(CLOSE_PROTOCOL_ERROR, 'Invalid control frame')
+    if length > MAX_MESSAGE_SIZE:
+        raise FrameError(CLOSE_TOO_BIG, 'Frame too big')
+    if masked:
+        mask = yield from reader.readexactly(4)
+        payload = bytearray((yield from reader.readexactly(length)))
+        unmask(mask, payload)
+    else:
+        payload = yield from reader.readexactly(length)
+    return fin, opcode, payload
+
+
+class WebSocketServer(server.Server):
+    """Listener speaking IRC over WebSocket, one text frame per line.
+
+    Clients accepted here are ordinary Client instances put on the same
+    queue as the plain TCP ones, only the framing differs.
+    """
+
+    kind = 'websocket'
+
+    def __init__(self, port=8067, host='0.0.0.0', **kwargs):
+        super().__init__(port, host, **kwargs)
+
+    def encode_line(self, line):
+        # on fan-out the frame built here is shared by every recipient
+        # on this listener
+        return build_frame(line.encode(self.encoding))
+
+    def send_close(self, writer, code=CLOSE_NORMAL):
+        write_frame(writer, struct.pack('!H', code), OP_CLOSE)
+
+    @asyncio.coroutine
+    def read_headers(self, reader):
+        request_line = yield from reader.readline()
+        if not request_line.startswith(b'GET '):
+            raise HandshakeError('Not a GET request')
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = yield from reader.readline()
+            line = line.strip()
+            if not line:
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        raise HandshakeError('Too many headers')
+
+    @asyncio.coroutine
+    def handshake(self, reader, writer):
+        try:
+            headers = yield from self.read_headers(reader)
+        except ValueError:
+            # raised by readline for lines over the StreamReader limit
+            raise HandshakeError('Header line too long')
+
+        if headers.get('upgrade', '').lower() != 'websocket':
+            raise HandshakeError('Missing upgrade header')
+        if headers.get('sec-websocket-version') != '13':
+            raise HandshakeError('Unsupported Sec-WebSocket-Version')
+        key = headers.get('sec-websocket-key', '')
+        try:
+            valid_key = len(base64.b64decode(
+                key.encode('ascii'), validate=True)) == 16
+        except ValueError:
+            valid_key = False
+        if not valid_key:
+            raise HandshakeError('Invalid Sec-WebSocket-Key')
+
+        response = [
+            'HTTP/1.1 101 Switching Protocols',
+            'Upgrade: websocket',
+            'Connection: Upgrade',
+            'Sec-WebSocket-Accept: {}'.format(
+                accept_key(key)),
+        ]
+        protocols = headers.get('sec-websocket-protocol', '')
+        if SUBPROTOCOL in [p.strip() for p in protocols.split(',')]:
+            response.append('Sec-WebSocket-Protocol: {}'.format(SUBPROTOCOL))
+        writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+
+    @asyncio.coroutine
+    def protocol_handler(self, reader, clnt):
+        fragments = None  # payload of the fragmented message being read
+        while True:
+            try:
+                fin, opcode, payload = yield from read_frame(
+                    reader, require_mask=True)
+            except (asyncio.IncompleteReadError, ConnectionResetError):
+                break
+            except FrameError as exc:
+                self.send_close(clnt.writer, exc.code)
+                break
+
+            if opcode == OP_CLOSE:
+                self.send_close(clnt.writer)
+                break
+            elif opcode == OP_PING:
+                write_frame(clnt.writer, payload, OP_PONG)
+                continue
+            elif opcode == OP_PONG:
+                continue
+            elif opcode == OP_CONTINUATION:
+                if fragments is None:
+                    # nothing to continue
+                    self.send_close(clnt.writer, CLOSE_PROTOCOL_ERROR)
+                    break
+            elif opcode in (OP_TEXT, OP_BINARY):
+                if fragments is not None:
+                    # a new message before the previous one was finished
+                    self.send_close(clnt.writer, CLOSE_PROTOCOL_ERROR)
+                    break
+            else:
+                self.send_close(clnt.writer, CLOSE_PROTOCOL_ERROR)
+                break
+
+            if not fin or fragments is not None:
+                if fragments is None:
+                    fragments = bytearray()
+                fragments += payload
+                if len(fragments) > MAX_MESSAGE_SIZE:
+                    self.send_close(clnt.writer, CLOSE_TOO_BIG)
+                    break
+                if not fin:
+                    continue
+                payload, fragments = fragments, None
+
+            # the common case is exactly one line per frame, which is
+            # handed on without splitting it again
+            if b'\n' in payload:
+                for line in payload.split(b'\n'):
+                    yield from self.handle_line(clnt, line)
+            else:
+                yield from self.handle_line(clnt, payload)
+        clnt.writer.close()
+        yield from self.queue.put(
+            (server.EVENT_LOST_CLIENT, clnt)
+        )
+
+    @asyncio.coroutine
+    def new_client(self, reader: StreamReader, writer: StreamWriter):
+        try:
+            yield from self.handshake(reader, writer)
+        except (HandshakeError, ConnectionResetError):
+            writer.write(b'HTTP/1.1 400 Bad Request\r\n'
+                         b'Sec-WebSocket-Version: 13\r\n\r\n')
+            writer.close()
+            return
+        clnt = client.Client(self, writer)
+        asyncio.async(self.protocol_handler(reader, clnt))
+        yield from self.queue.put((server.EVENT_NEW_CLIENT, clnt))
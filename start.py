@@ -1,11 +1,19 @@
-
+import os
 import asyncio
-from pyircd import Ircd, server
+from pyircd import Ircd, server, websocket
 
 
 loop = asyncio.get_event_loop()
-ircd = Ircd(loop=loop)
+# set PYIRCD_CAPTURE to a file name to record traffic for pyircd.replay
+ircd = Ircd(loop=loop, capture_path=os.environ.get('PYIRCD_CAPTURE'))
 ircd.add_server(server.Server(port=6667, loop=loop))
 ircd.add_server(server.Server(port=6668, loop=loop))
+ircd.add_server(websocket.WebSocketServer(port=8067, loop=loop))
+# kill -USR1 <pid> writes a 30s profile in collapsed stack format
+ircd.install_profile_signal()
 asyncio.async(ircd.run_forever())
-loop.run_forever()
+try:
+    loop.run_forever()
+finally:
+    if ircd.capture is not None:
+        ircd.capture.close()